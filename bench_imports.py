@@ -0,0 +1,57 @@
+"""
+Import-time benchmark.
+
+Imports each module in a fresh interpreter (as a spawned worker process would)
+and reports the cumulative import time given by ``python -X importtime``.
+
+Usage:
+    python bench_imports.py [module ...]
+"""
+
+import subprocess
+import sys
+
+
+DEFAULT_MODULES = [
+    "prey_predator.model",
+    "prey_predator.mean_field",
+    "optimize_utils",
+    "fast_run",
+]
+
+
+def import_time(module: str, repeats: int = 5) -> float:
+    """Measures the time it takes to import a module in a fresh interpreter.
+
+    Args:
+        module (str): dotted name of the module to import
+        repeats (int): number of fresh interpreters to spawn
+
+    Returns:
+        seconds (float): best cumulative import time over all repeats
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        # The last line of the report is the requested module itself, and its
+        # cumulative column includes everything it pulled in.
+        last_line = result.stderr.strip().splitlines()[-1]
+        cumulative_us = int(last_line.split("|")[1])
+        best = min(best, cumulative_us / 1e6)
+    return best
+
+
+def main():
+    modules = sys.argv[1:] or DEFAULT_MODULES
+    width = max(len(module) for module in modules)
+    for module in modules:
+        print(f"{module:<{width}}  {1000 * import_time(module):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
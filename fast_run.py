@@ -1,18 +1,42 @@
+import random
+from typing import TYPE_CHECKING, Optional
+
 from prey_predator.model import WolfSheep
-import matplotlib.pyplot as plt
-from tqdm import tqdm
 
+if TYPE_CHECKING:
+    from results_store import ResultsStore
+
+
+def run_model(store: Optional["ResultsStore"] = None, study: str = "fast_run", trajectory_every: int = 100, **model_kwargs):
+    from tqdm import tqdm
+
+    if store is not None and model_kwargs.get("seed") is None:
+        # stored runs must be reproducible
+        model_kwargs["seed"] = random.randrange(2**31)
 
-def run_model(**model_kwargs):
     model = WolfSheep(**model_kwargs)
     pbar = tqdm(range(100_000), position=1, leave=False, desc='Running model', unit='steps')
     for _ in pbar:
         model.step()
+    if store is not None:
+        from results_store import model_params
+
+        model_vars = model.datacollector.model_vars
+        store.append(
+            study,
+            model_params(model),
+            model_kwargs["seed"],
+            model_vars["Wolves"],
+            model_vars["Sheep"],
+            trajectory_every=trajectory_every,
+        )
     df = model.datacollector.get_model_vars_dataframe()
     return df.reset_index(names="step")
 
 
 def main():
+    import matplotlib.pyplot as plt
+
     params = dict(
         height=20,
         width=20,
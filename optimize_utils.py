@@ -1,43 +1,104 @@
-import optuna
+import random
+from statistics import stdev
+from typing import TYPE_CHECKING, Optional
+
 from prey_predator.model import WolfSheep
-from prey_predator.agents import Wolf, Sheep
+from prey_predator.mean_field import MeanFieldCalibration, MeanFieldPrefilter, collapse_step
+
+if TYPE_CHECKING:
+    # optuna is only needed for annotations; the study itself is created by the
+    # caller, so worker processes never pay for importing it here.
+    import optuna
+    from results_store import ResultsStore
 
 
-def run_model_until_collapse(timeout: int, lb : int = 0, up : int = 400, **model_kwargs) -> float:
+def run_model_until_collapse(
+    timeout: int,
+    lb : int = 0,
+    up : int = 400,
+    store: Optional["ResultsStore"] = None,
+    study: str = "default",
+    trajectory_every: int = 0,
+    **model_kwargs,
+) -> float:
     """Runs the model until either the wolf of sheep population collapses.
 
     Args:
         timeout (int): maximum number of steps
         lb (int) : lower bound to break the simulation
         up (int) : upper bound to break the simulation
+        store (ResultsStore, optional) : if given, the run is appended to it
+        study (str) : study (partition of the store) the run belongs to
+        trajectory_every (int) : downsampling of the stored trajectory (0 to not store it)
         model_kwargs : model args
 
     Returns:
         obj_val (float): Step count plus the standard deviation in the populations of sheep and wolves
     """
+    if store is not None and model_kwargs.get("seed") is None:
+        # stored runs must be reproducible
+        model_kwargs["seed"] = random.randrange(2**31)
+
     model = WolfSheep(**model_kwargs)
-    step = -1
-    for step in range(timeout):
-        model.step()
-
-        #collect the data of populations
-        wolf_count = model.schedule.get_breed_count(Wolf)
-        sheep_count = model.schedule.get_breed_count(Sheep)
-        
-        # threshold to break the simulation
-        if min(wolf_count, sheep_count) <= lb or max(wolf_count, sheep_count) > up:
-            break
-
-    df = model.datacollector.get_model_vars_dataframe()
+    steps = model.run_until_collapse(timeout, lb, up)
+
+    # read the raw collected lists instead of building a DataFrame per run
+    model_vars = model.datacollector.model_vars
     std = 0
-    if step > 0:
+    if steps > 1:
         #std of both populations
-        std = df["Wolves"].std(ddof=1) + df["Sheep"].std(ddof=1)
+        std = stdev(model_vars["Wolves"]) + stdev(model_vars["Sheep"])
+
+    if store is not None:
+        from results_store import model_params
+
+        store.append(
+            study,
+            model_params(model),
+            model_kwargs["seed"],
+            model_vars["Wolves"],
+            model_vars["Sheep"],
+            trajectory_every=trajectory_every,
+        )
 
-    return step + 1 + std
+    return steps + std
 
 
-def objective(trial: optuna.Trial, trial_ranges, timeout : int = 100_000, samples : int = 3) -> float:
+def run_mean_field_until_collapse(
+    timeout: int,
+    lb : int = 0,
+    up : int = 400,
+    calibration: Optional[MeanFieldCalibration] = None,
+    **model_kwargs,
+) -> float:
+    """Runs the mean-field model until either the wolf of sheep population collapses.
+
+    Same criterion and objective value as run_model_until_collapse, using the
+    rounded mean-field populations. See mean_field.collapse_step.
+
+    Args:
+        timeout (int): maximum number of steps
+        lb (int) : lower bound to break the simulation
+        up (int) : upper bound to break the simulation
+        calibration (MeanFieldCalibration, optional) : rate corrections of the mean-field model
+        model_kwargs : model args
+
+    Returns:
+        obj_val (float): Step count plus the standard deviation in the populations of sheep and wolves
+    """
+    steps, std = collapse_step(model_kwargs, timeout, calibration, lb, up, with_std=True)
+    return steps + std
+
+
+def objective(
+    trial: "optuna.Trial",
+    trial_ranges,
+    timeout : int = 100_000,
+    samples : int = 3,
+    store: Optional["ResultsStore"] = None,
+    trajectory_every: int = 0,
+    prefilter: Optional[MeanFieldPrefilter] = None,
+) -> float:
     """
     Objective function to be optimized. Takes a trial and simulate it with suggested parameters. Run the simulation 'samples' times and return the mean.
 
@@ -45,6 +106,14 @@ def objective(trial: optuna.Trial, trial_ranges, timeout : int = 100_000, sample
         trial (optuna.Trial): Object from Optuna to perform suggestions
         timeout (int) : number of steps to break a simulation
         samples (int) : number of simulations to be executed
+        store (ResultsStore, optional) : if given, every simulation is appended
+            to it, partitioned by the name of the trial's study
+        trajectory_every (int) : downsampling of the stored trajectories
+        prefilter (MeanFieldPrefilter, optional) : if given and validated
+            (see mean_field.calibrate), the calibrated mean-field model is run
+            first, and if it collapses before margin * horizon steps its
+            objective value is returned without running the simulations.
+            The trial's "prefiltered" user attribute records which path was taken.
 
     Returns:
         obj_val (float) : the mean of running 'samples' simulations
@@ -64,7 +133,27 @@ def objective(trial: optuna.Trial, trial_ranges, timeout : int = 100_000, sample
         "moore": trial.suggest_categorical("moore", trial_ranges["moore"]),
     }
     
+    if prefilter is not None and prefilter.validated:
+        steps, std = collapse_step(
+            params, prefilter.horizon, prefilter.calibration, with_std=True
+        )
+        prefiltered = prefilter.rejects(steps)
+        trial.set_user_attr("prefiltered", prefiltered)
+        if prefiltered:
+            return steps + std
+
+    # only trials run by a study have a name to partition the store by
+    study = trial.study.study_name if store is not None else "default"
+
     times = []
     for _ in range(samples):
-        times.append(run_model_until_collapse(timeout=timeout, **params))
+        times.append(
+            run_model_until_collapse(
+                timeout=timeout,
+                store=store,
+                study=study,
+                trajectory_every=trajectory_every,
+                **params,
+            )
+        )
     return sum(times) / len(times)
@@ -0,0 +1,17 @@
+"""
+Collapse criterion shared by the agent-based and the mean-field models.
+"""
+
+
+def collapsed(wolf_count: int, sheep_count: int, lb: int = 0, up: int = 400) -> bool:
+    """
+    Whether either population has collapsed: fallen to lb or below, or
+    exploded above up.
+
+    Args:
+        wolf_count (int): number of wolves
+        sheep_count (int): number of sheep
+        lb (int) : lower bound to break the simulation
+        up (int) : upper bound to break the simulation
+    """
+    return min(wolf_count, sheep_count) <= lb or max(wolf_count, sheep_count) > up
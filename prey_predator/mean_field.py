@@ -0,0 +1,559 @@
+"""
+Mean-field approximation of the Prey-Predator model
+================================
+
+Instead of simulating every agent, the populations of sheep and wolves and the
+fraction of fully grown grass are treated as continuous quantities updated once
+per step by a Lotka-Volterra-style difference equation. Encounters use the
+probability that a cell is occupied when agents are spread uniformly on the
+grid (1 - exp(-agents / cells)). The total energy of each population is
+tracked as well, and the fractions of agents that starve or are able to
+reproduce follow from its mean. A handful of multiplicative coefficients
+(MeanFieldCalibration) absorb what the approximation leaves out (spatial
+correlation, energy distribution, demographic noise). They are fitted to the
+collapse steps of runs of the agent-based WolfSheep model, and checked on
+held-out runs, with calibrate.
+
+A step costs a few microseconds and only the standard library is needed
+(mesa is imported by calibrate alone), so the model is meant for screening
+parameter sets before running the full simulation.
+"""
+
+import math
+import random
+import warnings
+from typing import Dict, Iterable, NamedTuple, Optional, Sequence, Tuple, Union
+
+from prey_predator.collapse import collapsed
+
+
+DEFAULT_HORIZON = 1_000
+
+# Measured on agent-based runs drawn around the notebook's search space: with
+# larger margins the mean-field model rejects too many runs that survive.
+DEFAULT_MARGIN = 0.02
+
+
+class MeanFieldCalibration(NamedTuple):
+    """
+    Multiplicative corrections applied to the mean-field rates.
+    """
+
+    grazing: float = 1.0
+    predation: float = 1.0
+    sheep_starvation: float = 1.0
+    wolf_starvation: float = 1.0
+
+
+def _low_energy_fraction(energy: float, population: float, scale: float) -> float:
+    """
+    Fraction of a population with less than one unit of energy, i.e. about to
+    starve, assuming energies are exponentially distributed around the mean.
+    Starving agents have (almost) no energy, so the total energy is unchanged.
+    """
+    if population <= 0:
+        return 0.0
+    if energy <= 0:
+        return 1.0
+    return min(scale * -math.expm1(-population / energy), 1.0)
+
+
+def _fertile_fraction(energy: float, population: float) -> float:
+    """
+    Fraction of a population with more than one unit of energy, which is
+    required to reproduce. Offspring take half of the parent's energy, so
+    births leave the total energy unchanged.
+    """
+    if population <= 0 or energy <= 0:
+        return 0.0
+    return math.exp(-population / energy)
+
+
+class MeanFieldWolfSheep:
+    """
+    Mean-field Wolf-Sheep Predation Model
+    """
+
+    description = (
+        "A mean-field (Lotka-Volterra-style) approximation of the wolf and sheep"
+        " predator-prey model, with a grass compartment."
+    )
+
+    def __init__(
+        self,
+        height: int = 20,
+        width: int = 20,
+        initial_sheep: int = 100,
+        initial_wolves: int = 50,
+        sheep_reproduce: float = 0.04,
+        wolf_reproduce: float = 0.05,
+        wolf_gain_from_food: int = 20,
+        grass: bool = True,
+        grass_regrowth_time: int = 30,
+        sheep_gain_from_food: int = 4,
+        moore: bool = True,
+        seed: Optional[int] = None,
+        calibration: Optional[MeanFieldCalibration] = None,
+    ):
+        """
+        Create a new mean-field model. Takes the same parameters as WolfSheep.
+
+        Args:
+            initial_sheep (int): Number of sheep to start with
+            initial_wolves (int): Number of wolves to start with
+            sheep_reproduce (float): Probability of each sheep reproducing each step
+            wolf_reproduce (float): Probability of each wolf reproducing each step
+            wolf_gain_from_food (int): Energy a wolf gains from eating a sheep
+            grass (bool): Whether to have the sheep eat grass for energy
+            grass_regrowth_time (int): How long it takes for a grass patch to regrow
+                once it is eaten
+            sheep_gain_from_food (int): Energy sheep gain from grass, if enabled.
+            moore (bool): Unused, movement is not modelled. Accepted so that the
+                same parameters can be passed to both models.
+            seed (int, optional): Unused, the model is deterministic.
+            calibration (MeanFieldCalibration, optional): Rate corrections.
+                If None, the uncorrected mean-field rates are used.
+        """
+        self.height = height
+        self.width = width
+        self.initial_sheep = initial_sheep
+        self.initial_wolves = initial_wolves
+        self.sheep_reproduce = sheep_reproduce
+        self.wolf_reproduce = wolf_reproduce
+        self.wolf_gain_from_food = wolf_gain_from_food
+        self.grass = grass
+        self.grass_regrowth_time = grass_regrowth_time
+        self.sheep_gain_from_food = sheep_gain_from_food
+        self.moore = moore
+        self.calibration = calibration or MeanFieldCalibration()
+
+        self.sheep = float(initial_sheep)
+        self.wolves = float(initial_wolves)
+        # Total energy of each population. Initial energies of WolfSheep are
+        # uniform in [0, 2 * gain), so the mean is gain - 1/2.
+        self.sheep_energy = self.sheep * max(sheep_gain_from_food - 0.5, 0.0)
+        self.wolf_energy = self.wolves * max(wolf_gain_from_food - 0.5, 0.0)
+        # The grass patches of WolfSheep start fully grown with probability 1/2
+        self.grown_grass = 0.5 if grass else 0.0
+        self.steps = 0
+        self.converged = False
+
+    def step(self):
+        """
+        Performs a step of the model, in the same order as the scheduler of
+        WolfSheep: sheep, then wolves, then grass.
+
+        Sets converged to True once the state stops changing, in which case
+        every later step would leave it unchanged.
+        """
+        cal = self.calibration
+        cells = self.width * self.height
+        previous = self._state()
+
+        # Sheep: starve, graze on the grown patches they land on, reproduce
+        if self.sheep > 0:
+            if self.grass:
+                self.sheep -= self.sheep * _low_energy_fraction(
+                    self.sheep_energy, self.sheep, cal.sheep_starvation
+                )
+                occupied = 1 - math.exp(-self.sheep / cells)
+                eaten = min(
+                    cal.grazing * self.grown_grass * cells * occupied,
+                    self.grown_grass * cells,
+                    self.sheep,
+                )
+                self.grown_grass -= eaten / cells
+                self.sheep_energy += self.sheep_gain_from_food * eaten - self.sheep
+            self.sheep_energy = max(self.sheep_energy, 0.0)
+            self.sheep += self.sheep_reproduce * self.sheep * _fertile_fraction(
+                self.sheep_energy, self.sheep
+            )
+
+        # Wolves: eat a sheep if there is any on their cell, starve, reproduce
+        if self.wolves > 0:
+            occupied = 1 - math.exp(-self.sheep / cells)
+            eaten = min(cal.predation * self.wolves * occupied, self.sheep)
+            if self.sheep > 0:
+                self.sheep_energy -= self.sheep_energy * eaten / self.sheep
+            self.sheep -= eaten
+            self.wolf_energy += self.wolf_gain_from_food * eaten - self.wolves
+            self.wolf_energy = max(self.wolf_energy, 0.0)
+            self.wolves -= self.wolves * _low_energy_fraction(
+                self.wolf_energy, self.wolves, cal.wolf_starvation
+            )
+            self.wolves += self.wolf_reproduce * self.wolves * _fertile_fraction(
+                self.wolf_energy, self.wolves
+            )
+
+        # Grass: an eaten patch is grown again after grass_regrowth_time + 1 steps
+        if self.grass:
+            self.grown_grass += (1 - self.grown_grass) / (self.grass_regrowth_time + 1)
+            self.grown_grass = min(max(self.grown_grass, 0.0), 1.0)
+
+        self.steps += 1
+        self.converged = all(
+            abs(new - old) <= 1e-9 * max(1.0, abs(old))
+            for new, old in zip(self._state(), previous)
+        )
+
+    def _state(self) -> Tuple[float, ...]:
+        return (
+            self.sheep,
+            self.wolves,
+            self.sheep_energy,
+            self.wolf_energy,
+            self.grown_grass,
+        )
+
+    def get_counts(self) -> Tuple[int, int]:
+        """
+        Returns the number of wolves and sheep, rounded to whole agents.
+        """
+        return round(self.wolves), round(self.sheep)
+
+    def run_model(self, step_count: int = 200):
+        """
+        Run the model for step_count steps.
+
+        Args:
+            step_count (int): Number of steps to run.
+        """
+        for _ in range(step_count):
+            self.step()
+            if self.converged:
+                break
+
+
+def collapse_step(
+    params: Dict[str, float],
+    horizon: int,
+    calibration: Optional[MeanFieldCalibration] = None,
+    lb: int = 0,
+    up: int = 400,
+    with_std: bool = False,
+) -> Union[int, Tuple[int, float]]:
+    """
+    Number of steps until the rounded mean-field populations collapse, with
+    the same criterion as WolfSheep.run_until_collapse. Once the model reaches
+    a fixed point the populations stay constant, so the remaining steps are
+    accounted for without being simulated.
+
+    Args:
+        params (dict): model parameters
+        horizon (int): maximum number of steps
+        calibration (MeanFieldCalibration, optional): rate corrections
+        lb (int) : lower bound to break the simulation
+        up (int) : upper bound to break the simulation
+        with_std (bool): also return the summed standard deviation of the
+            wolf and sheep counts over the steps run
+
+    Returns:
+        steps (int): steps run, horizon if the populations did not collapse
+        std (float): only if with_std
+    """
+    model = MeanFieldWolfSheep(**params, calibration=calibration)
+    # running count, sum and sum of squares of the wolf and sheep counts
+    sums = [[0, 0.0, 0.0], [0, 0.0, 0.0]]
+
+    def add(counts, times=1):
+        for total, count in zip(sums, counts):
+            total[0] += times
+            total[1] += times * count
+            total[2] += times * count * count
+
+    steps = horizon
+    for step in range(horizon):
+        model.step()
+        counts = model.get_counts()
+        add(counts)
+        if collapsed(*counts, lb, up):
+            steps = step + 1
+            break
+        if model.converged:
+            add(counts, horizon - step - 1)
+            break
+
+    if not with_std:
+        return steps
+    std = 0.0
+    if steps > 1:
+        for n, total, total_sq in sums:
+            std += max(0.0, (total_sq - total * total / n) / (n - 1)) ** 0.5
+    return steps, std
+
+
+def abm_collapse_step(
+    params: Dict[str, float], horizon: int, seed: int, lb: int = 0, up: int = 400
+) -> int:
+    """
+    Number of steps until the populations of the agent-based WolfSheep model
+    collapse. See WolfSheep.run_until_collapse.
+    """
+    from prey_predator.model import WolfSheep
+
+    return WolfSheep(**{**params, "seed": seed}).run_until_collapse(horizon, lb, up)
+
+
+Run = Tuple[Dict[str, float], int]
+
+
+class CalibrationReport(NamedTuple):
+    """
+    How well a calibration predicts the collapse of agent-based runs.
+
+    horizon, margin: the pre-filter settings the runs were evaluated with
+    runs: number of runs evaluated
+    not_early_runs: number of runs that did not collapse early (before
+        margin * horizon), i.e. the runs a false rejection can be measured on
+    accuracy: fraction of runs for which collapsing within the horizon or not
+        is predicted correctly
+    false_rejection_rate: fraction of the not_early_runs which the pre-filter
+        would reject. Meaningless if not_early_runs is 0.
+    rejection_rate: fraction of all runs the pre-filter would reject
+    """
+
+    horizon: int
+    margin: float
+    runs: int
+    not_early_runs: int
+    accuracy: float
+    false_rejection_rate: float
+    rejection_rate: float
+
+
+def calibration_loss(
+    calibration: MeanFieldCalibration, runs: Iterable[Run], horizon: int
+) -> float:
+    """
+    Mean squared error between the logarithms of the collapse steps predicted
+    by the mean-field model and those of agent-based runs.
+
+    Args:
+        calibration (MeanFieldCalibration): corrections to evaluate
+        runs (iterable of (params, steps)): model parameters of each
+            agent-based run and its abm_collapse_step
+        horizon (int): horizon the collapse steps were measured with
+
+    Returns:
+        loss (float): mean over all runs
+    """
+    total, count = 0.0, 0
+    for params, steps in runs:
+        predicted = collapse_step(params, horizon, calibration)
+        total += (math.log(predicted) - math.log(steps)) ** 2
+        count += 1
+    return total / max(count, 1)
+
+
+def fit_calibration(
+    runs: Sequence[Run],
+    horizon: int,
+    initial: Optional[MeanFieldCalibration] = None,
+    step_size: float = 0.5,
+    min_step_size: float = 1e-2,
+    bound: float = 2.0,
+) -> MeanFieldCalibration:
+    """
+    Fits the calibration coefficients to the collapse steps of agent-based runs.
+
+    Performs a pattern search on the logarithm of the coefficients, minimizing
+    calibration_loss.
+
+    Args:
+        runs (sequence of (params, steps)): see calibration_loss
+        horizon (int): horizon the collapse steps were measured with
+        initial (MeanFieldCalibration, optional): starting point.
+            If None, all coefficients start at 1.
+        step_size (float): initial step, in log-space
+        min_step_size (float): the search stops once the step is this small
+        bound (float): the coefficients are kept within [exp(-bound), exp(bound)]
+
+    Returns:
+        calibration (MeanFieldCalibration): fitted coefficients
+    """
+
+    def loss(log_coefficients):
+        return calibration_loss(
+            MeanFieldCalibration(*map(math.exp, log_coefficients)), runs, horizon
+        )
+
+    best = list(map(math.log, initial or MeanFieldCalibration()))
+    best_loss = loss(best)
+    while step_size >= min_step_size:
+        improved = False
+        for i in range(len(best)):
+            for direction in (1, -1):
+                candidate = list(best)
+                candidate[i] += direction * step_size
+                if abs(candidate[i]) > bound:
+                    continue
+                candidate_loss = loss(candidate)
+                if candidate_loss < best_loss:
+                    best, best_loss, improved = candidate, candidate_loss, True
+                    break
+        if not improved:
+            step_size /= 2
+    return MeanFieldCalibration(*map(math.exp, best))
+
+
+def evaluate_calibration(
+    calibration: MeanFieldCalibration,
+    runs: Sequence[Run],
+    horizon: int,
+    margin: float = DEFAULT_MARGIN,
+) -> CalibrationReport:
+    """
+    Compares the collapses predicted by the mean-field model with those of
+    agent-based runs, ideally ones that were not used for fitting.
+
+    Args:
+        calibration (MeanFieldCalibration): corrections to evaluate
+        runs (sequence of (params, steps)): see calibration_loss
+        horizon (int): horizon the collapse steps were measured with
+        margin (float): the pre-filter rejects a run when the mean-field
+            model collapses before margin * horizon steps
+
+    Returns:
+        report (CalibrationReport): classification rates over the runs
+    """
+    prefilter = MeanFieldPrefilter(calibration, horizon, margin)
+    correct = rejected = not_early = false_rejected = 0
+    for params, steps in runs:
+        predicted = collapse_step(params, horizon, calibration)
+        correct += (predicted < horizon) == (steps < horizon)
+        rejects = prefilter.rejects(predicted)
+        rejected += rejects
+        if steps >= margin * horizon:
+            not_early += 1
+            false_rejected += rejects
+    n_runs = len(runs)
+    return CalibrationReport(
+        horizon=horizon,
+        margin=margin,
+        runs=n_runs,
+        not_early_runs=not_early,
+        accuracy=correct / max(n_runs, 1),
+        false_rejection_rate=false_rejected / max(not_early, 1),
+        rejection_rate=rejected / max(n_runs, 1),
+    )
+
+
+class MeanFieldPrefilter:
+    """
+    Decides which parameter sets can skip the agent-based simulation: those
+    for which the calibrated mean-field model collapses well before the horizon.
+    """
+
+    def __init__(
+        self,
+        calibration: MeanFieldCalibration,
+        horizon: int = DEFAULT_HORIZON,
+        margin: float = DEFAULT_MARGIN,
+        report: Optional[CalibrationReport] = None,
+        max_false_rejection_rate: float = 0.05,
+        min_validation_runs: int = 20,
+        min_not_early_runs: int = 10,
+    ):
+        """
+        calibration (MeanFieldCalibration) : rate corrections of the mean-field model
+        horizon (int) : number of mean-field steps to run
+        margin (float) : a parameter set is rejected when the mean-field model
+            collapses before margin * horizon steps
+        report (CalibrationReport, optional) : held-out evaluation of the
+            calibration, with the same horizon and margin
+        max_false_rejection_rate (float) : the pre-filter is only validated
+            if the report's false rejection rate does not exceed this
+        min_validation_runs (int) : the pre-filter is only validated if the
+            report covers at least this many held-out runs
+        min_not_early_runs (int) : the pre-filter is only validated if the
+            report covers at least this many held-out runs that did not
+            collapse early, on which false rejections are measured
+        """
+        self.calibration = calibration
+        self.horizon = horizon
+        self.margin = margin
+        self.report = report
+        self.max_false_rejection_rate = max_false_rejection_rate
+        self.min_validation_runs = min_validation_runs
+        self.min_not_early_runs = min_not_early_runs
+
+    @property
+    def validated(self) -> bool:
+        """
+        Whether the calibration was checked, with this horizon and margin, on
+        enough held-out runs and rarely rejects parameter sets that do not
+        collapse early.
+        """
+        return (
+            self.report is not None
+            and self.report.horizon == self.horizon
+            and self.report.margin == self.margin
+            and self.report.runs >= self.min_validation_runs
+            and self.report.not_early_runs >= self.min_not_early_runs
+            and self.report.false_rejection_rate <= self.max_false_rejection_rate
+        )
+
+    def rejects(self, steps: int) -> bool:
+        """
+        Whether a mean-field collapse after the given number of steps is early
+        enough to skip the agent-based simulation.
+        """
+        return steps < self.margin * self.horizon
+
+
+def calibrate(
+    param_sets: Sequence[Dict[str, float]],
+    horizon: int = DEFAULT_HORIZON,
+    seeds: Iterable[int] = (0, 1, 2),
+    holdout: float = 0.25,
+    margin: float = DEFAULT_MARGIN,
+    split_seed: int = 0,
+    **fit_kwargs,
+) -> MeanFieldPrefilter:
+    """
+    Runs the agent-based model on each parameter set, fits the mean-field
+    model to the collapse steps of part of the parameter sets and evaluates
+    it on the rest.
+
+    Args:
+        param_sets (sequence of dict): WolfSheep parameters
+        horizon (int): maximum number of steps of each agent-based run
+        seeds (iterable of int): seeds of the agent-based runs for each parameter set
+        holdout (float): fraction of the parameter sets, chosen at random,
+            kept out of the fit to evaluate it
+        margin (float): see MeanFieldPrefilter
+        split_seed (int): seed of the random choice of held-out parameter sets
+        fit_kwargs : passed to fit_calibration
+
+    Returns:
+        prefilter (MeanFieldPrefilter): fitted pre-filter, with its held-out
+            CalibrationReport
+    """
+    seeds = list(seeds)
+    param_sets = list(param_sets)
+    random.Random(split_seed).shuffle(param_sets)
+    n_train = len(param_sets) - int(round(holdout * len(param_sets)))
+    runs = [
+        [(params, abm_collapse_step(params, horizon, seed)) for seed in seeds]
+        for params in param_sets
+    ]
+    train = [run for param_runs in runs[:n_train] for run in param_runs]
+    test = [run for param_runs in runs[n_train:] for run in param_runs]
+
+    calibration = fit_calibration(train, horizon, **fit_kwargs)
+    report = evaluate_calibration(calibration, test, horizon, margin)
+    prefilter = MeanFieldPrefilter(calibration, horizon, margin, report)
+    if not prefilter.validated:
+        if report.not_early_runs < prefilter.min_not_early_runs:
+            reason = (
+                f"only {report.not_early_runs} held-out runs survived past"
+                f" margin * horizon = {margin * horizon:g} steps, too few to"
+                " measure false rejections"
+            )
+        else:
+            reason = str(report)
+        warnings.warn(
+            f"mean-field calibration failed validation ({reason}), "
+            "the pre-filter will not reject any parameter set"
+        )
+    return prefilter
@@ -16,6 +16,7 @@ from mesa.space import MultiGrid
 from mesa.datacollection import DataCollector
 from mesa import Agent
 from prey_predator.agents import Sheep, Wolf, GrassPatch
+from prey_predator.collapse import collapsed
 from prey_predator.schedule import RandomActivationByBreed
 
 
@@ -43,6 +44,7 @@ class WolfSheep(Model):
         grass_regrowth_time: int = 30,
         sheep_gain_from_food: int = 4,
         moore: bool = True,
+        seed: Optional[int] = None,
     ):
         """
         Create a new Wolf-Sheep model with the given parameters.
@@ -59,6 +61,9 @@ class WolfSheep(Model):
             sheep_gain_from_food (int): Energy sheep gain from grass, if enabled.
             moore (bool): if True, may move in all 8 directions.
                 Otherwise, only up, left, down and right.
+            seed (int, optional): Seed for the model's random number generator
+                (consumed by mesa's Model.__new__). If None, the run is not
+                reproducible.
         """
         super().__init__()
         # Set parameters
@@ -231,3 +236,23 @@ class WolfSheep(Model):
 
         for _ in range(step_count):
             self.step()
+
+    def run_until_collapse(self, timeout: int, lb: int = 0, up: int = 400) -> int:
+        """
+        Run the model until either the wolf or sheep population collapses.
+
+        Args:
+            timeout (int): maximum number of steps
+            lb (int) : lower bound to break the simulation
+            up (int) : upper bound to break the simulation
+
+        Returns:
+            steps (int): number of steps run, timeout if no population collapsed
+        """
+        for step in range(timeout):
+            self.step()
+            wolf_count = self.schedule.get_breed_count(Wolf)
+            sheep_count = self.schedule.get_breed_count(Sheep)
+            if collapsed(wolf_count, sheep_count, lb, up):
+                return step + 1
+        return timeout
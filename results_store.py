@@ -0,0 +1,433 @@
+"""
+Columnar on-disk store for run results.
+
+Each study is a partition (a directory under the store root). Every column of
+the per-run summaries is a flat binary file that is appended to and read back
+through ``numpy.memmap``, so queries only touch the columns (and rows) they
+need. Downsampled population trajectories are concatenated in two more flat
+files and located through the ``traj_offset``/``traj_length`` columns.
+
+The model parameters and the seed are indexed: for each of those columns a
+sorted copy of the values and the matching row permutation are kept next to
+the data, and range conditions on them are answered with a binary search.
+Indexes are rebuilt lazily, on the first query after new runs were appended.
+
+Appends and index rebuilds hold an OS-level lock on ``<study>/.lock``, so any
+number of threads, ResultsStore instances and processes can write to the same
+study.
+
+Layout::
+
+    <root>/<study>/.lock
+    <root>/<study>/<column>.bin
+    <root>/<study>/trajectories/{wolves,sheep}.bin
+    <root>/<study>/index/<column>.{values,rows}.bin
+"""
+
+import contextlib
+import operator
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+PARAM_COLUMNS = {
+    "height": np.int64,
+    "width": np.int64,
+    "initial_sheep": np.int64,
+    "initial_wolves": np.int64,
+    "sheep_reproduce": np.float64,
+    "wolf_reproduce": np.float64,
+    "wolf_gain_from_food": np.int64,
+    "grass": np.bool_,
+    "grass_regrowth_time": np.int64,
+    "sheep_gain_from_food": np.int64,
+    "moore": np.bool_,
+}
+
+INDEXED_COLUMNS = {**PARAM_COLUMNS, "seed": np.int64}
+
+SUMMARY_COLUMNS = {
+    "steps": np.int64,
+    "final_wolves": np.int64,
+    "final_sheep": np.int64,
+    "traj_every": np.int64,
+    "traj_offset": np.int64,
+    "traj_length": np.int64,
+}
+
+COLUMNS = {**INDEXED_COLUMNS, **SUMMARY_COLUMNS}
+
+TRAJECTORY_DTYPE = np.int32
+
+_OPERATORS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+}
+
+Condition = Tuple[str, str, float]
+
+
+def model_params(model) -> Dict[str, float]:
+    """
+    Returns the values of PARAM_COLUMNS of a model, including the defaults it
+    was constructed with.
+    """
+    return {column: getattr(model, column) for column in PARAM_COLUMNS}
+
+
+def _write_atomic(path: str, values: np.ndarray):
+    """
+    Replace a file with the given values without touching the old file, which
+    other threads may still have memory-mapped.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(np.ascontiguousarray(values).tobytes())
+    os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def _file_lock(path: str):
+    """
+    Hold an exclusive lock on a file. The lock is taken by the OS on each open
+    of the file, so it excludes other threads as well as other processes.
+    """
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _read_column(path: str, dtype, count: Optional[int] = None) -> np.ndarray:
+    """
+    Map a flat binary column file read-only, or return an empty array if the
+    file is missing or empty.
+    """
+    itemsize = np.dtype(dtype).itemsize
+    if count is None:
+        count = os.path.getsize(path) // itemsize if os.path.exists(path) else 0
+    if count == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+def _append_column(path: str, values: np.ndarray):
+    with open(path, "ab") as f:
+        f.write(np.ascontiguousarray(values).tobytes())
+
+
+class StudyPartition:
+    """
+    The runs of a single study, stored column by column under one directory.
+    """
+
+    def __init__(self, path: str):
+        """
+        path (str) : directory of the partition. Created if it does not exist.
+        """
+        self.path = path
+        os.makedirs(os.path.join(path, "trajectories"), exist_ok=True)
+        os.makedirs(os.path.join(path, "index"), exist_ok=True)
+
+    def _lock(self):
+        return _file_lock(os.path.join(self.path, ".lock"))
+
+    def _column_path(self, column: str) -> str:
+        return os.path.join(self.path, f"{column}.bin")
+
+    def _trajectory_path(self, name: str) -> str:
+        return os.path.join(self.path, "trajectories", f"{name}.bin")
+
+    def _index_paths(self, column: str) -> Tuple[str, str]:
+        base = os.path.join(self.path, "index", column)
+        return f"{base}.values.bin", f"{base}.rows.bin"
+
+    def __len__(self) -> int:
+        """
+        Number of complete rows. A row is complete once its value has been
+        written to every column, so a partially appended row is ignored.
+        """
+        counts = []
+        for column, dtype in COLUMNS.items():
+            path = self._column_path(column)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            counts.append(size // np.dtype(dtype).itemsize)
+        return min(counts)
+
+    def column(self, column: str) -> np.ndarray:
+        """
+        Returns a read-only memory-mapped view of a column.
+        """
+        return _read_column(self._column_path(column), COLUMNS[column], len(self))
+
+    def append(
+        self,
+        params: Dict[str, float],
+        seed: int,
+        wolves: Sequence[int],
+        sheep: Sequence[int],
+        trajectory_every: int = 0,
+    ) -> int:
+        """
+        Append the summary (and optionally the downsampled trajectory) of a run.
+
+        Args:
+            params (dict): model parameters, one value for each of PARAM_COLUMNS
+            seed (int): seed the model was run with
+            wolves (sequence of int): wolf population after each step
+            sheep (sequence of int): sheep population after each step
+            trajectory_every (int): keep one of every trajectory_every steps
+                of the trajectory. If 0, no trajectory is stored.
+
+        Returns:
+            row (int): index of the new row in the partition
+        """
+        missing = set(PARAM_COLUMNS) - set(params)
+        if missing:
+            raise ValueError(f"missing model parameters: {sorted(missing)}")
+
+        if trajectory_every > 0:
+            traj_wolves = np.asarray(wolves[::trajectory_every], dtype=TRAJECTORY_DTYPE)
+            traj_sheep = np.asarray(sheep[::trajectory_every], dtype=TRAJECTORY_DTYPE)
+        else:
+            traj_wolves = traj_sheep = np.empty(0, dtype=TRAJECTORY_DTYPE)
+
+        with self._lock():
+            row = len(self)
+            self._truncate(row)
+
+            traj_path = self._trajectory_path("wolves")
+            itemsize = np.dtype(TRAJECTORY_DTYPE).itemsize
+            traj_offset = os.path.getsize(traj_path) // itemsize if os.path.exists(traj_path) else 0
+            _append_column(traj_path, traj_wolves)
+            _append_column(self._trajectory_path("sheep"), traj_sheep)
+
+            values = {
+                **{column: params[column] for column in PARAM_COLUMNS},
+                "seed": seed,
+                "steps": len(wolves),
+                "final_wolves": wolves[-1] if len(wolves) else 0,
+                "final_sheep": sheep[-1] if len(sheep) else 0,
+                "traj_every": trajectory_every,
+                "traj_offset": traj_offset,
+                "traj_length": len(traj_wolves),
+            }
+            for column, dtype in COLUMNS.items():
+                _append_column(self._column_path(column), np.array([values[column]], dtype=dtype))
+        return row
+
+    def _truncate(self, rows: int):
+        """
+        Drop any partially written row left behind by an interrupted append,
+        so that all columns stay aligned, along with its trajectory data.
+        """
+        for column, dtype in COLUMNS.items():
+            path = self._column_path(column)
+            size = rows * np.dtype(dtype).itemsize
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+        traj_end = 0
+        if rows > 0:
+            last = rows - 1
+            traj_end = int(
+                _read_column(self._column_path("traj_offset"), np.int64, rows)[last]
+                + _read_column(self._column_path("traj_length"), np.int64, rows)[last]
+            )
+        size = traj_end * np.dtype(TRAJECTORY_DTYPE).itemsize
+        for name in ("wolves", "sheep"):
+            path = self._trajectory_path(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _index(self, column: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the sorted values of an indexed column and the rows they come
+        from, rebuilding the index if rows were appended since it was built.
+        """
+        values_path, rows_path = self._index_paths(column)
+        dtype = INDEXED_COLUMNS[column]
+        # Appends take the same lock, so the row count, the column data and
+        # the index files all describe the same rows.
+        with self._lock():
+            n_rows = len(self)
+            if _read_column(rows_path, np.int64).shape[0] != n_rows:
+                data = np.array(_read_column(self._column_path(column), dtype, n_rows))
+                order = np.argsort(data, kind="stable")
+                _write_atomic(values_path, data[order])
+                _write_atomic(rows_path, order.astype(np.int64))
+            return _read_column(values_path, dtype, n_rows), _read_column(rows_path, np.int64, n_rows)
+
+    def _index_lookup(self, column: str, op: str, value: float) -> np.ndarray:
+        values, rows = self._index(column)
+        left = np.searchsorted(values, value, side="left")
+        right = np.searchsorted(values, value, side="right")
+        bounds = {
+            "<": (0, left),
+            "<=": (0, right),
+            ">": (right, len(values)),
+            ">=": (left, len(values)),
+            "==": (left, right),
+        }
+        start, stop = bounds[op]
+        return np.sort(rows[start:stop])
+
+    def query(self, conditions: Iterable[Condition] = ()) -> np.ndarray:
+        """
+        Find the rows matching all the given conditions.
+
+        Conditions on indexed columns are resolved first with a binary search
+        on the index; the remaining conditions are only evaluated on the rows
+        that are left.
+
+        Args:
+            conditions (iterable of (column, op, value)): op is one of
+                "<", "<=", ">", ">=" and "==".
+
+        Returns:
+            rows (np.ndarray): sorted indices of the matching rows
+        """
+        conditions = list(conditions)
+        for column, op, _ in conditions:
+            if column not in COLUMNS:
+                raise ValueError(f"unknown column: {column!r}")
+            if op not in _OPERATORS:
+                raise ValueError(f"unknown operator: {op!r}")
+
+        rows = None
+        for column, op, value in conditions:
+            if column in INDEXED_COLUMNS:
+                matches = self._index_lookup(column, op, value)
+                rows = matches if rows is None else np.intersect1d(rows, matches, assume_unique=True)
+
+        if rows is None:
+            rows = np.arange(len(self))
+        for column, op, value in conditions:
+            if column not in INDEXED_COLUMNS and len(rows):
+                rows = rows[_OPERATORS[op](self.column(column)[rows], value)]
+        return rows
+
+    def trajectory(self, row: int) -> Dict[str, np.ndarray]:
+        """
+        Returns the downsampled trajectory of a run as memory-mapped arrays.
+        """
+        offset = int(self.column("traj_offset")[row])
+        length = int(self.column("traj_length")[row])
+        trajectory = {}
+        for label, name in (("Wolves", "wolves"), ("Sheep", "sheep")):
+            data = _read_column(self._trajectory_path(name), TRAJECTORY_DTYPE)
+            trajectory[label] = data[offset : offset + length]
+        return trajectory
+
+
+class ResultsStore:
+    """
+    A collection of study partitions rooted at a directory.
+
+    Example:
+        store = ResultsStore("results")
+        store.query(("grass_regrowth_time", "<", 20), ("steps", ">", 50_000))
+    """
+
+    def __init__(self, root: str):
+        """
+        root (str) : directory holding one sub-directory per study.
+        """
+        self.root = root
+        self._partitions: Dict[str, StudyPartition] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def studies(self) -> List[str]:
+        """
+        Returns the names of all the studies in the store.
+        """
+        return sorted(
+            name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name))
+        )
+
+    def study(self, name: str, create: bool = True) -> StudyPartition:
+        """
+        Returns the partition of a study.
+
+        Args:
+            name (str): name of the study
+            create (bool): whether to create the study if it does not exist.
+                If False, a ValueError is raised for unknown studies.
+        """
+        if not name or name.startswith(".") or os.sep in name or (os.altsep and os.altsep in name):
+            raise ValueError(f"invalid study name: {name!r}")
+        if not create and not os.path.isdir(os.path.join(self.root, name)):
+            raise ValueError(f"unknown study: {name!r}")
+        with self._lock:
+            if name not in self._partitions:
+                self._partitions[name] = StudyPartition(os.path.join(self.root, name))
+            return self._partitions[name]
+
+    def append(self, study: str, *args, **kwargs) -> int:
+        """
+        Append a run to a study. See StudyPartition.append for the arguments.
+        """
+        return self.study(study).append(*args, **kwargs)
+
+    def query(self, *conditions: Condition, studies: Optional[Iterable[str]] = None) -> "pd.DataFrame":
+        """
+        Find the runs matching all the given conditions across studies.
+
+        Args:
+            conditions ((column, op, value)): op is one of
+                "<", "<=", ">", ">=" and "==".
+            studies (iterable of str, optional): existing studies to search.
+                If None, all studies are searched.
+
+        Returns:
+            runs (pd.DataFrame): one row per matching run, with the summary
+                columns plus "study" and "row" (to load its trajectory).
+        """
+        import pandas as pd
+
+        if isinstance(studies, str):
+            raise TypeError("studies must be an iterable of study names, not a str")
+
+        frames = []
+        for name in self.studies() if studies is None else studies:
+            partition = self.study(name, create=False)
+            rows = partition.query(conditions)
+            frame = pd.DataFrame({column: partition.column(column)[rows] for column in COLUMNS})
+            frame.insert(0, "row", rows)
+            frame.insert(0, "study", name)
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=["study", "row", *COLUMNS])
+        return pd.concat(frames, ignore_index=True)
+
+    def trajectory(self, study: str, row: int) -> Dict[str, np.ndarray]:
+        """
+        Returns the downsampled trajectory of a run. See StudyPartition.trajectory.
+        """
+        return self.study(study, create=False).trajectory(row)